@@ -2,12 +2,17 @@
 
 from __future__ import annotations
 
+import asyncio
 import sys
-from collections import Counter
+from array import array
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from operator import neg
 from pathlib import Path
-from typing import Literal
+from typing import Literal, NamedTuple
 
-from fastapi import FastAPI, HTTPException, Query
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
@@ -27,7 +32,7 @@ def _ensure_repo_root_on_syspath() -> None:
 
 _ensure_repo_root_on_syspath()
 
-from category_wordfreq import get_category_counts
+from category_wordfreq import get_category_counts, sorted_rows
 
 
 FrontendMetric = Literal["count", "freq"]
@@ -35,6 +40,7 @@ FrontendMetric = Literal["count", "freq"]
 DEFAULT_TOP_N = 200
 DEFAULT_MIN_COUNT = 1
 DEFAULT_SLEEP_SECONDS = 0.0
+ROWS_CACHE_SIZE = 64
 
 DEFAULT_ALLOWED_ORIGINS = (
     "http://localhost:5173",
@@ -75,13 +81,101 @@ def create_app() -> FastAPI:
 app = create_app()
 
 
-def _sorted_rows(counts: Counter[str], *, min_count: int, top_n: int) -> list[tuple[str, int]]:
-    rows = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+class CategoryRows(NamedTuple):
+    """Word/count columns for a category, sorted by count desc then word."""
+
+    total_words: int
+    words: tuple[str, ...]
+    counts: array
+
+
+_ROWS_CACHE: OrderedDict[str, CategoryRows] = OrderedDict()
+_INFLIGHT: dict[str, tuple[asyncio.Task[CategoryRows], bool]] = {}
+
+
+async def _category_rows(category: str, *, refresh: bool, sleep: float) -> CategoryRows:
+    """Return the sorted rows for a category.
+
+    Kept in a small in-process LRU so repeated requests that only vary
+    `top`/`metric`/`min_count` skip the full sort and sum. `refresh` bypasses it.
+    Counts are stored as a packed int64 column rather than one tuple per word.
+    Concurrent misses for the same category share a single build; a refresh only
+    shares an in-flight refresh build.
+    """
+
+    if not refresh:
+        cached = _ROWS_CACHE.get(category)
+        if cached is not None:
+            _ROWS_CACHE.move_to_end(category)
+            return cached
+
+    # No await between the lookup and the insert, so this is race-free on the loop.
+    inflight = _INFLIGHT.get(category)
+    if inflight is not None and (inflight[1] or not refresh):
+        task = inflight[0]
+    else:
+        previous = inflight[0] if inflight is not None else None
+        task = asyncio.create_task(
+            _build_category_rows(category, refresh=refresh, sleep=sleep, after=previous)
+        )
+        _INFLIGHT[category] = (task, refresh)
+        task.add_done_callback(lambda done: _forget_inflight(category, done))
+
+    # Shielded so one client disconnecting does not cancel the build for the others.
+    return await asyncio.shield(task)
+
+
+def _forget_inflight(category: str, task: asyncio.Task[CategoryRows]) -> None:
+    inflight = _INFLIGHT.get(category)
+    if inflight is not None and inflight[0] is task:
+        del _INFLIGHT[category]
+
+
+def _rows_from_counts(counts: Counter[str]) -> CategoryRows:
+    rows = sorted_rows(counts)
+    return CategoryRows(
+        total_words=int(sum(counts.values())),
+        words=tuple(word for (word, _count) in rows),
+        counts=array("q", [count for (_word, count) in rows]),
+    )
+
+
+async def _build_category_rows(
+    category: str,
+    *,
+    refresh: bool,
+    sleep: float,
+    after: asyncio.Task[CategoryRows] | None = None,
+) -> CategoryRows:
+    if after is not None:
+        # A refresh that overtakes a plain build waits for it, so the older build
+        # cannot overwrite the refreshed rows in the cache when it finishes.
+        await asyncio.wait({after})
+
+    counts = await get_category_counts(category, refresh=refresh, sleep=sleep)
+    # Sorting a full vocabulary takes long enough to stall other requests, so
+    # it runs off the event loop.
+    entry = await asyncio.to_thread(_rows_from_counts, counts)
+    if not entry.words:
+        # Not memoized, so a mistyped or briefly empty category is re-listed next time.
+        return entry
+
+    _ROWS_CACHE[category] = entry
+    _ROWS_CACHE.move_to_end(category)
+    if len(_ROWS_CACHE) > ROWS_CACHE_SIZE:
+        _ROWS_CACHE.popitem(last=False)
+    return entry
+
+
+def _sorted_rows(all_rows: CategoryRows, *, min_count: int, top_n: int) -> list[tuple[str, int]]:
+    end = len(all_rows.words)
     if min_count > 1:
-        rows = [(word, count) for (word, count) in rows if count >= min_count]
+        # Counts are sorted descending, so rows with count >= min_count form a
+        # prefix whose end can be found by binary search instead of a filter pass.
+        end = bisect_right(all_rows.counts, -min_count, key=neg)
     if top_n > 0:
-        rows = rows[:top_n]
-    return rows
+        end = min(end, top_n)
+    return list(zip(all_rows.words[:end], all_rows.counts[:end]))
 
 
 def _build_items(
@@ -89,37 +183,51 @@ def _build_items(
     *,
     metric: FrontendMetric,
     total_words: int,
-) -> list[WordItem]:
+) -> list[dict[str, str | float]]:
     if metric == "freq":
         denom = float(total_words) if total_words else 1.0
-        return [WordItem(text=word, value=float(count) / denom) for (word, count) in rows]
-    return [WordItem(text=word, value=float(count)) for (word, count) in rows]
+        return [{"text": word, "value": count / denom} for (word, count) in rows]
+    return [{"text": word, "value": float(count)} for (word, count) in rows]
+
 
+def _json_response(payload: dict[str, object]) -> Response:
+    # orjson encodes the payload directly, independent of which FastAPI
+    # version (and therefore which serializer) is installed.
+    return Response(orjson.dumps(payload), media_type="application/json")
 
-@app.get("/api/wordfreq", response_model=WordFreqResponse)
-def api_wordfreq(
+
+# The route returns a ready-made orjson `Response` built from plain dicts, so no
+# `WordItem` is created per row; `WordFreqResponse` only documents the schema.
+@app.get(
+    "/api/wordfreq",
+    response_model=None,
+    responses={200: {"model": WordFreqResponse}},
+)
+async def api_wordfreq(
     category: str = Query(..., min_length=1),
     refresh: bool = False,
     sleep: float = Query(DEFAULT_SLEEP_SECONDS, ge=0.0),
     top: int = Query(DEFAULT_TOP_N, ge=0),
     metric: FrontendMetric = "count",
     min_count: int = Query(DEFAULT_MIN_COUNT, ge=1),
-) -> WordFreqResponse:
+) -> Response:
     category = category.strip()
     if not category:
         raise HTTPException(status_code=400, detail="category is required")
 
-    counts = get_category_counts(category, refresh=refresh, sleep=sleep)
-    if not counts:
+    all_rows = await _category_rows(category, refresh=refresh, sleep=sleep)
+    if not all_rows.words:
         raise HTTPException(status_code=404, detail="no pages or no words found for category")
 
-    total_words = int(sum(counts.values()))
-    rows = _sorted_rows(counts, min_count=min_count, top_n=top)
+    total_words = all_rows.total_words
+    rows = _sorted_rows(all_rows, min_count=min_count, top_n=top)
     items = _build_items(rows, metric=metric, total_words=total_words)
 
-    return WordFreqResponse(
-        category=category,
-        metric=metric,
-        total_words=total_words,
-        items=items,
+    return _json_response(
+        {
+            "category": category,
+            "metric": metric,
+            "total_words": total_words,
+            "items": items,
+        }
     )
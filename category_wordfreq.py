@@ -1,23 +1,33 @@
 #!/usr/bin/env python3
 
 import argparse
-import json
+import asyncio
+import email.utils
+import heapq
 import os
+import pickle
 import re
 import sys
+import tempfile
 import time
 from collections import Counter
+from contextlib import aclosing
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import AsyncIterator, Dict, List, Tuple
 
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import httpx
+import orjson
+import zstandard
 
 API_ENDPOINT = "https://en.wikipedia.org/w/api.php"
+FETCH_CONCURRENCY = 8
+MAX_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 0.8
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CACHE_ZSTD_LEVEL = 3
 
 
-STOPWORDS = {
+STOPWORDS = frozenset({
     "a","about","above","after","again","against","all","am","an","and","any","are","aren't","as","at",
     "be","because","been","before","being","below","between","both","but","by",
     "can","can't","cannot","could","couldn't",
@@ -40,35 +50,58 @@ STOPWORDS = {
     "when's","where","where's","which","while","who","who's","whom","why","why's","with","won't",
     "would","wouldn't",
     "you","you'd","you'll","you're","you've","your","yours","yourself","yourselves",
-}
+})
 
 
-def _make_session() -> requests.Session:
-    session = requests.Session()
-    session.headers.update({"User-Agent": "wikipedia_analysis/1.0 (category_wordfreq.py)"})
-
-    retry = Retry(
-        total=5,
-        connect=5,
-        read=5,
-        backoff_factor=0.8,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=("GET",),
-        raise_on_status=False,
+def _make_client() -> httpx.AsyncClient:
+    # HTTP/2 lets the concurrent batch fetches multiplex over one TLS connection.
+    # All retries, connect failures included, live in _http_get_json.
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+    )
+    return httpx.AsyncClient(
+        headers={"User-Agent": "wikipedia_analysis/1.0 (category_wordfreq.py)"},
+        timeout=30.0,
+        transport=transport,
     )
-    adapter = HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=10)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
-
 
-_SESSION = _make_session()
 
+def _retry_after_seconds(resp: httpx.Response) -> float | None:
+    value = resp.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+async def _http_get_json(client: httpx.AsyncClient, params: Dict[str, str]) -> Dict:
+    for attempt in range(MAX_RETRIES + 1):
+        last_attempt = attempt == MAX_RETRIES
+        delay = RETRY_BACKOFF_SECONDS * (2**attempt)
+        try:
+            resp = await client.get(API_ENDPOINT, params=params)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+        else:
+            if resp.status_code not in RETRY_STATUSES or last_attempt:
+                break
+            # Honor the server's requested wait (typically on 429/503) over our backoff.
+            retry_after = _retry_after_seconds(resp)
+            if retry_after is not None:
+                delay = retry_after
+        await asyncio.sleep(delay)
 
-def _http_get_json(params: Dict[str, str]) -> Dict:
-    resp = _SESSION.get(API_ENDPOINT, params=params, timeout=30)
     resp.raise_for_status()
-    return resp.json()
+    return orjson.loads(resp.content)
 
 
 def _normalize_category(category: str) -> str:
@@ -79,117 +112,242 @@ def _normalize_category(category: str) -> str:
 
 def _cache_file_for_category(category: str) -> Path:
     safe = re.sub(r"[^A-Za-z0-9._-]+", "_", _normalize_category(category).strip()) or "_"
-    return Path(__file__).resolve().parent / ".cache" / f"category_{safe}.json"
+    return Path(__file__).resolve().parent / ".cache" / f"category_{safe}.pkl.zst"
+
+
+def _cache_file_for_page(pageid: int) -> Path:
+    return Path(__file__).resolve().parent / ".cache" / "pages" / f"{pageid}.pkl.zst"
+
+
+def _compress_cache(raw: bytes) -> bytes:
+    # Level 3 shrinks word-count pickles several-fold for a few ms of CPU, and
+    # decompressing is cheaper than reading the extra bytes from a cold disk.
+    return zstandard.ZstdCompressor(level=CACHE_ZSTD_LEVEL).compress(raw)
+
+
+def _decompress_cache(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def _write_cache_file(cache_file: Path, raw: bytes) -> None:
+    # A unique temp file per write keeps concurrent builds that share a page from
+    # clobbering each other's partial file before the atomic replace.
+    data = _compress_cache(raw)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(dir=cache_file.parent, suffix=".tmp", delete=False)
+    try:
+        with tmp:
+            tmp.write(data)
+        os.replace(tmp.name, cache_file)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
 
 
 def _load_cached_counts(category: str) -> Counter[str] | None:
+    # Cache files are only ever written by _save_cached_counts on this host, so
+    # unpickling them is safe and skips re-validating every entry.
     cache_file = _cache_file_for_category(category)
     try:
-        data = json.loads(cache_file.read_text(encoding="utf-8"))
+        data = pickle.loads(_decompress_cache(cache_file.read_bytes()))
     except FileNotFoundError:
         return None
     except Exception:
         return None
 
-    counts = data.get("counts")
-    if not isinstance(counts, dict):
+    counts = data.get("counts") if isinstance(data, dict) else None
+    if not isinstance(counts, Counter):
         return None
-
-    out: Counter[str] = Counter()
-    for k, v in counts.items():
-        if isinstance(k, str) and isinstance(v, int):
-            out[k] = v
-    return out
+    return counts
 
 
 def _save_cached_counts(category: str, counts: Counter[str]) -> None:
-    cache_file = _cache_file_for_category(category)
-    cache_file.parent.mkdir(parents=True, exist_ok=True)
     payload = {
         "category": _normalize_category(category),
         "created_at": time.time(),
         "total_words": int(sum(counts.values())),
-        "counts": dict(counts),
+        "counts": counts,
     }
-    tmp = cache_file.with_suffix(cache_file.suffix + ".tmp")
-    tmp.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
-    os.replace(tmp, cache_file)
+    _write_cache_file(_cache_file_for_category(category), pickle.dumps(payload, protocol=5))
+
 
+def _load_page_counts(pageid: int) -> Tuple[int, Counter[str]] | None:
+    cache_file = _cache_file_for_page(pageid)
+    try:
+        data = pickle.loads(_decompress_cache(cache_file.read_bytes()))
+    except FileNotFoundError:
+        return None
+    except Exception:
+        return None
+
+    if not (isinstance(data, tuple) and len(data) == 2 and isinstance(data[1], Counter)):
+        return None
+    return data
 
-def iter_category_pages(category: str) -> Iterable[Tuple[int, str]]:
-    cmtitle = category
-    if not cmtitle.startswith("Category:"):
-        cmtitle = f"Category:{cmtitle}"
 
-    cmcontinue: str | None = None
+def _save_page_counts(pageid: int, revid: int, counts: Counter[str]) -> None:
+    _write_cache_file(_cache_file_for_page(pageid), pickle.dumps((revid, counts), protocol=5))
+
+
+async def iter_category_pages(client: httpx.AsyncClient, category: str) -> AsyncIterator[Tuple[int, str, int]]:
+    """Yield `(pageid, title, lastrevid)` for every page in the category.
+
+    The listing is run as a generator with `prop=info`, so the current revision
+    of each page arrives with the listing itself instead of needing its own
+    round-trip before the per-page cache can be checked.
+    """
+
+    gcmtitle = category
+    if not gcmtitle.startswith("Category:"):
+        gcmtitle = f"Category:{gcmtitle}"
+
+    cont: Dict[str, str] = {}
     while True:
         params = {
             "action": "query",
             "format": "json",
-            "list": "categorymembers",
-            "cmtitle": cmtitle,
-            "cmtype": "page",
-            "cmlimit": "500",
+            "formatversion": "2",
+            "generator": "categorymembers",
+            "gcmtitle": gcmtitle,
+            "gcmtype": "page",
+            "gcmlimit": "500",
+            "prop": "info",
+            **cont,
         }
-        if cmcontinue:
-            params["cmcontinue"] = cmcontinue
 
-        data = _http_get_json(params)
-        members = data.get("query", {}).get("categorymembers", [])
-        for m in members:
-            yield int(m["pageid"]), str(m["title"])
+        data = await _http_get_json(client, params)
+        pages = data.get("query", {}).get("pages", [])
+        for p in pages:
+            yield int(p["pageid"]), str(p["title"]), int(p.get("lastrevid", 0))
 
-        cmcontinue = data.get("continue", {}).get("cmcontinue")
-        if not cmcontinue:
+        cont = data.get("continue", {})
+        if not cont:
             break
 
 
-def fetch_plaintext_extracts(pageids: List[int]) -> Dict[int, str]:
-    if not pageids:
-        return {}
-
-    # Conservative batching. MediaWiki limits vary by prop and user rights.
-    batch_size = 20
-    out: Dict[int, str] = {}
-
-    for i in range(0, len(pageids), batch_size):
-        batch = pageids[i : i + batch_size]
+async def _fetch_one_batch(client: httpx.AsyncClient, batch: List[int]) -> List[Dict]:
+    # Full-text extracts are clamped to one page per response, so follow the
+    # continuation until every page in the batch has its extract.
+    pages: Dict[int, Dict] = {}
+    cont: Dict[str, str] = {}
+    while True:
         params = {
             "action": "query",
             "format": "json",
             "formatversion": "2",
-            "prop": "extracts",
+            "prop": "extracts|info",
             "explaintext": "1",
             "exsectionformat": "plain",
             "pageids": "|".join(map(str, batch)),
+            **cont,
         }
-        data = _http_get_json(params)
-        pages = data.get("query", {}).get("pages", [])
-        for p in pages:
-            pid = int(p["pageid"])
-            out[pid] = str(p.get("extract", ""))
+        data = await _http_get_json(client, params)
+        for p in data.get("query", {}).get("pages", []):
+            pages.setdefault(int(p["pageid"]), {}).update(p)
 
-    return out
+        cont = data.get("continue", {})
+        if not cont:
+            break
 
+    return list(pages.values())
 
-_WORD_RE = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
 
+async def _iter_extract_batches(client: httpx.AsyncClient, pageids: List[int]) -> AsyncIterator[List[Dict]]:
+    # Conservative batching. MediaWiki limits vary by prop and user rights.
+    batch_size = 20
+    batches = [pageids[i : i + batch_size] for i in range(0, len(pageids), batch_size)]
 
-def tokenize(text: str) -> Iterable[str]:
-    for m in _WORD_RE.finditer(text):
-        w = m.group(0).lower()
-        w = w.strip("'")
-        if not w:
-            continue
-        yield w
+    # Batches are independent, so overlap their round-trips, yielding each as it lands.
+    sem = asyncio.Semaphore(FETCH_CONCURRENCY)
 
+    async def fetch(batch: List[int]) -> List[Dict]:
+        async with sem:
+            return await _fetch_one_batch(client, batch)
 
-def is_non_common(word: str) -> bool:
-    if word in STOPWORDS:
-        return False
-    if len(word) <= 2:
-        return False
-    return True
+    tasks = [asyncio.create_task(fetch(b)) for b in batches]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        # On error or early exit, don't leave fetches running against a client
+        # that is about to be closed.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _merge_cached_pages(pageids: List[int], revisions: Dict[int, int], counts: Counter[str]) -> List[int]:
+    stale: List[int] = []
+    for pid in pageids:
+        cached = _load_page_counts(pid)
+        if cached is not None and cached[0] == revisions.get(pid):
+            counts.update(cached[1])
+        else:
+            stale.append(pid)
+    return stale
+
+
+def _count_pages(pages: List[Dict], counts: Counter[str]) -> None:
+    for p in pages:
+        page_counts: Counter[str] = Counter()
+        count_words(str(p.get("extract", "")), page_counts)
+        drop_common_words(page_counts)
+        # Pages that came back without an extract (e.g. missing or unparsable)
+        # are not cached, so they get another chance on the next run.
+        if "extract" in p and "lastrevid" in p:
+            _save_page_counts(int(p["pageid"]), int(p["lastrevid"]), page_counts)
+        counts.update(page_counts)
+
+
+async def fetch_and_count(
+    client: httpx.AsyncClient,
+    pageids: List[int],
+    revisions: Dict[int, int],
+    counts: Counter[str],
+) -> None:
+    # Pages whose cached counts match the current revision are merged from disk;
+    # only the rest are fetched and tokenized, one batch at a time as they arrive.
+    # Disk and tokenizing work runs off the event loop so fetches keep progressing.
+    stale = await asyncio.to_thread(_merge_cached_pages, pageids, revisions, counts)
+    async with aclosing(_iter_extract_batches(client, stale)) as batches:
+        async for pages in batches:
+            await asyncio.to_thread(_count_pages, pages, counts)
+
+
+# Matched against already-lowercased text, see count_words().
+_WORD_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_WORD_RE_FINDALL = _WORD_RE.findall
+
+
+def count_words(text: str, counts: Counter[str]) -> None:
+    # Called once per page, since each page keeps its own cached Counter. The
+    # pattern never starts or ends on an apostrophe, so tokens need no stripping.
+    # Every token is tallied here and common words are pruned once per
+    # vocabulary entry by drop_common_words(), keeping the per-token path in C.
+    # The text is lowercased once up front rather than token by token.
+    counts.update(_WORD_RE_FINDALL(text.lower()))
+
+
+def drop_common_words(counts: Counter[str]) -> None:
+    # Stopwords and words of two letters or fewer are dropped; the stopword probe
+    # is a single C-level set intersection over the vocabulary.
+    common = set(STOPWORDS.intersection(counts))
+    common.update([w for w in counts if len(w) <= 2])
+    for w in common:
+        del counts[w]
+
+
+def _row_sort_key(kv: Tuple[str, int]) -> Tuple[int, str]:
+    return -kv[1], kv[0]
+
+
+def sorted_rows(counts: Counter[str], top_n: int = 0) -> List[Tuple[str, int]]:
+    """Rows ordered by count desc then word; only the top `top_n` when it is > 0."""
+    # A bounded heap is O(n log k) versus a full O(n log n) sort when only a
+    # few hundred of ~10^5 words are wanted.
+    if 0 < top_n < len(counts):
+        return heapq.nsmallest(top_n, counts.items(), key=_row_sort_key)
+    return sorted(counts.items(), key=_row_sort_key)
 
 
 def format_table(rows: List[Tuple[str, int]], total: int) -> str:
@@ -215,75 +373,45 @@ def main(argv: List[str]) -> int:
     ap.add_argument("--refresh", action="store_true", help="Recompute results instead of using cached output")
     args = ap.parse_args(argv)
 
-    counts: Counter[str] | None = None
-    if not args.refresh:
-        counts = _load_cached_counts(args.category)
-
-    if counts is None:
-        pageids: List[int] = []
-        for pid, _title in iter_category_pages(args.category):
-            pageids.append(pid)
-
-        if not pageids:
-            print("No pages found for category.", file=sys.stderr)
-            return 2
-
-        counts = Counter()
-
-        # Fetch content in batches
-        batch_size = 200
-        for i in range(0, len(pageids), batch_size):
-            batch = pageids[i : i + batch_size]
-            extracts = fetch_plaintext_extracts(batch)
-            for text in extracts.values():
-                for w in tokenize(text):
-                    if is_non_common(w):
-                        counts[w] += 1
+    counts = asyncio.run(get_category_counts(args.category, refresh=args.refresh, sleep=args.sleep))
+    if not counts:
+        print("No pages found for category.", file=sys.stderr)
+        return 2
 
-            if args.sleep > 0:
-                time.sleep(args.sleep)
-
-        _save_cached_counts(args.category, counts)
-
-    assert counts is not None
     total = sum(counts.values())
-    rows = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
-
-    if args.top and args.top > 0:
-        rows = rows[: args.top]
+    rows = sorted_rows(counts, top_n=args.top)
 
     print(format_table(rows, total))
     return 0
 
 
-def get_category_counts(category: str, refresh: bool = False, sleep: float = 0.0) -> Counter[str]:
+async def get_category_counts(category: str, refresh: bool = False, sleep: float = 0.0) -> Counter[str]:
     counts: Counter[str] | None = None
     if not refresh:
-        counts = _load_cached_counts(category)
+        counts = await asyncio.to_thread(_load_cached_counts, category)
 
     if counts is None:
-        pageids: List[int] = []
-        for pid, _title in iter_category_pages(category):
-            pageids.append(pid)
+        async with _make_client() as client:
+            pageids: List[int] = []
+            revisions: Dict[int, int] = {}
+            async for pid, _title, revid in iter_category_pages(client, category):
+                pageids.append(pid)
+                revisions[pid] = revid
 
-        if not pageids:
-            return Counter()
+            if not pageids:
+                return Counter()
 
-        counts = Counter()
+            counts = Counter()
 
-        batch_size = 200
-        for i in range(0, len(pageids), batch_size):
-            batch = pageids[i : i + batch_size]
-            extracts = fetch_plaintext_extracts(batch)
-            for text in extracts.values():
-                for w in tokenize(text):
-                    if is_non_common(w):
-                        counts[w] += 1
+            batch_size = 200
+            for i in range(0, len(pageids), batch_size):
+                batch = pageids[i : i + batch_size]
+                await fetch_and_count(client, batch, revisions, counts)
 
-            if sleep > 0:
-                time.sleep(sleep)
+                if sleep > 0:
+                    await asyncio.sleep(sleep)
 
-        _save_cached_counts(category, counts)
+        await asyncio.to_thread(_save_cached_counts, category, counts)
 
     return counts
 